@@ -130,7 +130,7 @@ class ConfigLoader:
             self.mod_path += "\\Sound\\Voice\\Mantella.esp"
 
             selected_actions = self.__definitions.get_string_list_value("active_actions")
-            self.actions = [a for a in self.__actions if a.name in selected_actions]
+            self.actions: tuple[action, ...] = tuple(a for a in self.__actions if a.name in selected_actions)
 
             self.language = self.__definitions.get_string_value("language")
             self.end_conversation_keyword = self.__definitions.get_string_value("end_conversation_keyword")
@@ -300,18 +300,13 @@ class conversation:
                     self.__sentences.put(goodbye_sentence)
                     
     @utils.time_it
-    def contains_character(self, ref_id: str) -> bool:
-        for actor in self.__context.npcs_in_conversation.get_all_characters():
-            if actor.ref_id == ref_id:
-                return True
-        return False
-    
-    @utils.time_it
-    def get_character(self, ref_id: str) -> Character | None:
-        for actor in self.__context.npcs_in_conversation.get_all_characters():
-            if actor.ref_id == ref_id:
-                return actor
-        return None
+    def get_characters_by_ref_id(self) -> dict[str, Character]:
+        """Gets all characters in the conversation in a single pass, keyed by their ref ID
+
+        Returns:
+            dict[str, Character]: the characters currently in the conversation
+        """
+        return {actor.ref_id: actor for actor in self.__context.npcs_in_conversation.get_all_characters()}
 
     @utils.time_it
     def end(self):
@@ -1,6 +1,7 @@
+import functools
 import logging
-from typing import Any, Hashable
-import regex
+from typing import Any, Callable, Final, Hashable
+import re
 from src.games.equipment import Equipment, EquipmentItem
 from src.games.external_character_info import external_character_info
 from src.games.gameable import gameable
@@ -18,14 +19,66 @@ import src.utils as utils
 from src.http.communication_constants import communication_constants as comm_consts
 from src.stt import Transcriber
 
+# Keys read or written on every request, bound once to skip the class attribute lookups
+_K_ACTORS: str = comm_consts.KEY_ACTORS
+_K_BASEID: str = comm_consts.KEY_ACTOR_BASEID
+_K_REFID: str = comm_consts.KEY_ACTOR_REFID
+_K_NAME: str = comm_consts.KEY_ACTOR_NAME
+_K_GENDER: str = comm_consts.KEY_ACTOR_GENDER
+_K_RACE: str = comm_consts.KEY_ACTOR_RACE
+_K_ISPLAYER: str = comm_consts.KEY_ACTOR_ISPLAYER
+_K_RELATIONSHIPRANK: str = comm_consts.KEY_ACTOR_RELATIONSHIPRANK
+_K_VOICETYPE: str = comm_consts.KEY_ACTOR_VOICETYPE
+_K_ISINCOMBAT: str = comm_consts.KEY_ACTOR_ISINCOMBAT
+_K_ISENEMY: str = comm_consts.KEY_ACTOR_ISENEMY
+_K_CUSTOMVALUES: str = comm_consts.KEY_ACTOR_CUSTOMVALUES
+_K_EQUIPMENT: str = comm_consts.KEY_ACTOR_EQUIPMENT
+_K_PC_VOICEMODEL: str = comm_consts.KEY_ACTOR_PC_VOICEMODEL
+_K_CONTEXT: str = comm_consts.KEY_CONTEXT
+_K_CONTEXT_LOCATION: str = comm_consts.KEY_CONTEXT_LOCATION
+_K_CONTEXT_TIME: str = comm_consts.KEY_CONTEXT_TIME
+_K_CONTEXT_INGAMEEVENTS: str = comm_consts.KEY_CONTEXT_INGAMEEVENTS
+_K_CONTEXT_WEATHER: str = comm_consts.KEY_CONTEXT_WEATHER
+_K_CONTEXT_CUSTOMVALUES: str = comm_consts.KEY_CONTEXT_CUSTOMVALUES
+_K_SPEAKER: str = comm_consts.KEY_ACTOR_SPEAKER
+_K_LINETOSPEAK: str = comm_consts.KEY_ACTOR_LINETOSPEAK
+_K_VOICEFILE: str = comm_consts.KEY_ACTOR_VOICEFILE
+_K_DURATION: str = comm_consts.KEY_ACTOR_DURATION
+_K_ACTIONS: str = comm_consts.KEY_ACTOR_ACTIONS
+
+# (key, caster, default) for the plain actor fields load_character reads on every update, in the order they are unpacked there
+_ACTOR_FIELDS: tuple[tuple[str, Callable[[Any], Any], Any], ...] = (
+    (_K_ISINCOMBAT, bool, False),
+    (_K_ISENEMY, bool, False),
+    (_K_RELATIONSHIPRANK, int, 0),
+    (_K_ISPLAYER, bool, False),
+)
+# Fields that never change for an actor and are only read when the character is not loaded yet
+_ACTOR_IDENTITY_FIELDS: tuple[tuple[str, Callable[[Any], Any], Any], ...] = (
+    (_K_GENDER, int, 0),
+    (_K_RACE, str, ''),
+    (_K_VOICETYPE, str, ''),
+)
+
+_WORLD_ID_CLEANSE_REGEX: Final[re.Pattern] = re.compile(r'[^A-Za-z0-9]+', re.ASCII)
+
+# Shared reply for requests that arrive without a running conversation. Callers only serialize replies, they never modify them
+_ERROR_NO_RUNNING_CONVERSATION: dict[str, Any] = {comm_consts.KEY_REPLYTYPE: "error", "mantella_message": "No running conversation."}
+
+# EquipmentItem is immutable, so the same worn item can be shared between actors and updates
+_make_equipment_item: Callable[[str], EquipmentItem] = functools.lru_cache(maxsize=4096)(EquipmentItem)
+# Equipment is never modified after construction, so all actors without equipment can share one instance
+_EMPTY_EQUIPMENT: Final[Equipment] = Equipment({})
+
 class CharacterDoesNotExist(Exception):
     """Exception raised when NPC name cannot be found in skyrim_characters.csv/fallout4_characters.csv"""
     pass
 
 
 class GameStateManager:
-    TOKEN_LIMIT_PERCENT: float = 0.45 # not used?
-    WORLD_ID_CLEANSE_REGEX: regex.Pattern = regex.compile('[^A-Za-z0-9]+')
+    __slots__ = ('__game', '__config', '__language_info', '__client', '__chat_manager', '__rememberer', '__talk',
+                 '__mic_input', '__mic_ptt', '__stt_api_file', '__api_file', '__stt', '__last_update_snapshot')
+    TOKEN_LIMIT_PERCENT: Final[float] = 0.45 # not used?
 
     @utils.time_it
     def __init__(self, game: gameable, chat_manager: ChatManager, config: ConfigLoader, language_info: dict[Hashable, str], client: openai_client, stt_api_file: str, api_file: str):        
@@ -41,6 +94,7 @@ class GameStateManager:
         self.__stt_api_file: str = stt_api_file
         self.__api_file: str = api_file
         self.__stt: Transcriber | None = None
+        self.__last_update_snapshot: tuple[Any, Any, int] | None = None
 
     ###### react to calls from the game #######
     @utils.time_it
@@ -48,17 +102,17 @@ class GameStateManager:
         if self.__talk: #This should only happen if game and server are out of sync due to some previous error -> close conversation and start a new one
             self.__talk.end()
             self.__talk = None
+        self.__last_update_snapshot = None
         world_id = "default"
-        if input_json.__contains__(comm_consts.KEY_STARTCONVERSATION_WORLDID):
-            world_id = input_json[comm_consts.KEY_STARTCONVERSATION_WORLDID]
-            world_id = self.WORLD_ID_CLEANSE_REGEX.sub("", world_id)
-        if input_json.__contains__(comm_consts.KEY_INPUTTYPE):
-            if input_json[comm_consts.KEY_INPUTTYPE] in (comm_consts.KEY_INPUTTYPE_MIC, comm_consts.KEY_INPUTTYPE_PTT):
-                self.__mic_input = True
-                # only init Transcriber if mic input is enabled
-                self.__stt = Transcriber(self.__config, self.__stt_api_file, self.__api_file)
-                if input_json[comm_consts.KEY_INPUTTYPE] == comm_consts.KEY_INPUTTYPE_PTT:
-                    self.__mic_ptt = True
+        if comm_consts.KEY_STARTCONVERSATION_WORLDID in input_json:
+            world_id = _WORLD_ID_CLEANSE_REGEX.sub("", input_json[comm_consts.KEY_STARTCONVERSATION_WORLDID])
+        input_type = input_json.get(comm_consts.KEY_INPUTTYPE)
+        if input_type in (comm_consts.KEY_INPUTTYPE_MIC, comm_consts.KEY_INPUTTYPE_PTT):
+            self.__mic_input = True
+            # only init Transcriber if mic input is enabled
+            self.__stt = Transcriber(self.__config, self.__stt_api_file, self.__api_file)
+            if input_type == comm_consts.KEY_INPUTTYPE_PTT:
+                self.__mic_ptt = True
                 
         context_for_conversation = context(world_id, self.__config, self.__client, self.__rememberer, self.__language_info, self.__client.is_text_too_long)
         self.__talk = conversation(context_for_conversation, self.__chat_manager, self.__rememberer, self.__client, self.__stt, self.__mic_input, self.__mic_ptt)
@@ -72,12 +126,11 @@ class GameStateManager:
     @utils.time_it
     def continue_conversation(self, input_json: dict[str, Any]) -> dict[str, Any]:
         if(not self.__talk ):
-            return self.error_message("No running conversation.")
+            return _ERROR_NO_RUNNING_CONVERSATION
         
-        if input_json.__contains__(comm_consts.KEY_REQUEST_EXTRA_ACTIONS):
-            extra_actions: list[str] = input_json[comm_consts.KEY_REQUEST_EXTRA_ACTIONS]
-            if extra_actions.__contains__(comm_consts.ACTION_RELOADCONVERSATION):
-                self.__talk.reload_conversation()
+        extra_actions: list[str] = input_json.get(comm_consts.KEY_REQUEST_EXTRA_ACTIONS, [])
+        if comm_consts.ACTION_RELOADCONVERSATION in extra_actions:
+            self.__talk.reload_conversation()
 
         self.__update_context(input_json)
 
@@ -103,7 +156,7 @@ class GameStateManager:
     @utils.time_it
     def player_input(self, input_json: dict[str, Any]) -> dict[str, Any]:
         if(not self.__talk ):
-            return self.error_message("No running conversation.")
+            return _ERROR_NO_RUNNING_CONVERSATION
         
         player_text: str = input_json[comm_consts.KEY_REQUESTTYPE_PLAYERINPUT]
         self.__update_context(input_json)
@@ -130,6 +183,7 @@ class GameStateManager:
         if(self.__talk):
             self.__talk.end()
             self.__talk = None
+        self.__last_update_snapshot = None
 
         logging.log(24, '\nConversations not starting when you select an NPC? See here:')
         logging.log(25, 'https://art-from-the-machine.github.io/Mantella/pages/issues_qna')
@@ -141,160 +195,171 @@ class GameStateManager:
     @utils.time_it
     def character_to_json(self, character_to_jsonfy: Character) -> dict[str, Any]:
         return {
-            comm_consts.KEY_ACTOR_BASEID: character_to_jsonfy.base_id,
-            comm_consts.KEY_ACTOR_NAME: character_to_jsonfy.name,
+            _K_BASEID: character_to_jsonfy.base_id,
+            _K_NAME: character_to_jsonfy.name,
         }
     
     @utils.time_it
     def sentence_to_json(self, sentence_to_prepare: sentence) -> dict[str, Any]:
         return {
-            comm_consts.KEY_ACTOR_SPEAKER: sentence_to_prepare.speaker.name,
-            comm_consts.KEY_ACTOR_LINETOSPEAK: sentence_to_prepare.sentence.strip(),
-            comm_consts.KEY_ACTOR_VOICEFILE: sentence_to_prepare.voice_file,
-            comm_consts.KEY_ACTOR_DURATION: sentence_to_prepare.voice_line_duration,
-            comm_consts.KEY_ACTOR_ACTIONS: sentence_to_prepare.actions
+            _K_SPEAKER: sentence_to_prepare.speaker.name,
+            _K_LINETOSPEAK: sentence_to_prepare.sentence.strip(),
+            _K_VOICEFILE: sentence_to_prepare.voice_file,
+            _K_DURATION: sentence_to_prepare.voice_line_duration,
+            _K_ACTIONS: sentence_to_prepare.actions
         }
 
     ##### utils #######
 
     @utils.time_it
     def __update_context(self,  json: dict[str, Any]):
-        if self.__talk:
-            if json.__contains__(comm_consts.KEY_ACTORS):
+        talk: conversation | None = self.__talk
+        if talk:
+            actors_json: list[dict[str, Any]] | None = json.get(_K_ACTORS)
+            context_json: dict[str, Any] | None = json.get(_K_CONTEXT)
+            # The game re-sends the same actors and context with every request. If nothing changed since the last update
+            # (and no characters were removed by the conversation in the meantime), there is nothing to load or update
+            has_ingame_events: bool = bool(context_json and context_json.get(_K_CONTEXT_INGAMEEVENTS))
+            if not has_ingame_events and self.__last_update_snapshot == (actors_json, context_json, len(talk.context.npcs_in_conversation)):
+                return
+
+            if actors_json is not None:
                 actors_in_json: list[Character] = []
-                for actorJson in json[comm_consts.KEY_ACTORS]:
-                    actor: Character | None = self.load_character(actorJson)                
+                loaded_characters: dict[str, Character] = talk.get_characters_by_ref_id()
+                for actorJson in actors_json:
+                    actor: Character | None = self.load_character(actorJson, loaded_characters)                
                     if actor:
                         actors_in_json.append(actor)
-                self.__talk.add_or_update_character(actors_in_json)
+                talk.add_or_update_character(actors_in_json)
             
-            location = None
-            time = None
-            ingame_events = None
-            weather = ""
+            location: str | None = None
+            time: int | None = None
+            ingame_events: list[str] | None = None
+            weather: str = ""
             custom_context_values: dict[str, Any] = {}
-            if json.__contains__(comm_consts.KEY_CONTEXT):
-                if json[comm_consts.KEY_CONTEXT].__contains__(comm_consts.KEY_CONTEXT_LOCATION):
-                    location: str = json[comm_consts.KEY_CONTEXT].get(comm_consts.KEY_CONTEXT_LOCATION, None)
-                
-                if json[comm_consts.KEY_CONTEXT].__contains__(comm_consts.KEY_CONTEXT_TIME):
-                    time: int = json[comm_consts.KEY_CONTEXT][comm_consts.KEY_CONTEXT_TIME]
-
-                if json[comm_consts.KEY_CONTEXT].__contains__(comm_consts.KEY_CONTEXT_INGAMEEVENTS):
-                    ingame_events: list[str] = json[comm_consts.KEY_CONTEXT][comm_consts.KEY_CONTEXT_INGAMEEVENTS]
-                
-                if json[comm_consts.KEY_CONTEXT].__contains__(comm_consts.KEY_CONTEXT_WEATHER):
-                    weather = self.__game.get_weather_description(json[comm_consts.KEY_CONTEXT][comm_consts.KEY_CONTEXT_WEATHER])
-
-                if json[comm_consts.KEY_CONTEXT].__contains__(comm_consts.KEY_CONTEXT_CUSTOMVALUES):
-                    custom_context_values = json[comm_consts.KEY_CONTEXT][comm_consts.KEY_CONTEXT_CUSTOMVALUES]
-            self.__talk.update_context(location, time, ingame_events, weather, custom_context_values)
+            if context_json is not None:
+                location = context_json.get(_K_CONTEXT_LOCATION)
+                time = context_json.get(_K_CONTEXT_TIME)
+                ingame_events = context_json.get(_K_CONTEXT_INGAMEEVENTS)
+                if _K_CONTEXT_WEATHER in context_json:
+                    weather = self.__game.get_weather_description(context_json[_K_CONTEXT_WEATHER])
+                custom_context_values = context_json.get(_K_CONTEXT_CUSTOMVALUES, {})
+            talk.update_context(location, time, ingame_events, weather, custom_context_values)
+            self.__last_update_snapshot = (actors_json, context_json, len(talk.context.npcs_in_conversation))
     
-    @utils.time_it
-    def load_character(self, json: dict[str, Any]) -> Character | None:
-        try:
-            base_id: str = utils.convert_to_skyrim_hex_format(str(json[comm_consts.KEY_ACTOR_BASEID]))
-            ref_id: str = utils.convert_to_skyrim_hex_format(str(json[comm_consts.KEY_ACTOR_REFID]))
-
-            # ignore plugin ID at the start of the ref ID as this can vary by load order
-            if ref_id.startswith('FE'):             #Item from lite mod, statically placed in CK, has 'FEXXX' prefix. 
-                ref_id = ref_id[-3:].rjust(6,"0")   #Mask off prefix, pad w/'0'
-            else:
-                ref_id = ref_id[-6:]
-            if base_id.startswith('FE'):
-                base_id = base_id[-3:].rjust(6,"0")
-            else:
-                base_id = base_id[-6:]
-
-            character_name: str = str(json[comm_consts.KEY_ACTOR_NAME])
-            gender: int = int(json[comm_consts.KEY_ACTOR_GENDER])
-            race: str = str(json[comm_consts.KEY_ACTOR_RACE])
-            actor_voice_model: str = str(json[comm_consts.KEY_ACTOR_VOICETYPE])
-            ingame_voice_model: str = actor_voice_model.split('<')[1].split(' ')[0]
-            is_in_combat: bool = bool(json[comm_consts.KEY_ACTOR_ISINCOMBAT])
-            is_enemy: bool = bool(json[comm_consts.KEY_ACTOR_ISENEMY])
-            relationship_rank: int = int(json[comm_consts.KEY_ACTOR_RELATIONSHIPRANK])
-            custom_values: dict[str, Any] = {}
-            if json.__contains__(comm_consts.KEY_ACTOR_CUSTOMVALUES):
-                custom_values = json[comm_consts.KEY_ACTOR_CUSTOMVALUES]
-                if not custom_values:
-                    custom_values: dict[str, Any] = {}
-            equipment = Equipment({})
-            if json.__contains__(comm_consts.KEY_ACTOR_EQUIPMENT):
-                equipment = Equipment(self.__convert_to_equipment_item_dictionary(json[comm_consts.KEY_ACTOR_EQUIPMENT]))
-            is_generic_npc: bool = False
-            bio: str = ""
-            tts_voice_model: str = ""
-            csv_in_game_voice_model: str = ""
-            advanced_voice_model: str = ""
-            voice_accent: str = ""
-            is_player_character: bool = bool(json[comm_consts.KEY_ACTOR_ISPLAYER])
-            if self.__talk and self.__talk.contains_character(ref_id):
-                already_loaded_character: Character | None = self.__talk.get_character(ref_id)
-                if already_loaded_character:
-                    bio = already_loaded_character.bio
-                    tts_voice_model = already_loaded_character.tts_voice_model
-                    csv_in_game_voice_model = already_loaded_character.csv_in_game_voice_model
-                    advanced_voice_model = already_loaded_character.advanced_voice_model
-                    voice_accent = already_loaded_character.voice_accent
-                    is_generic_npc = already_loaded_character.is_generic_npc
-            elif self.__talk and not is_player_character :#If this is not the player and the character has not already been loaded
-                external_info: external_character_info = self.__game.load_external_character_info(base_id, character_name, race, gender, actor_voice_model)
-                
-                bio = external_info.bio
-                tts_voice_model = external_info.tts_voice_model
-                csv_in_game_voice_model = external_info.csv_in_game_voice_model
-                advanced_voice_model = external_info.advanced_voice_model
-                voice_accent = external_info.voice_accent
-                is_generic_npc = external_info.is_generic_npc
-                if is_generic_npc:
-                    character_name = external_info.name
-                    ingame_voice_model = external_info.ingame_voice_model
-            elif self.__talk and is_player_character and self.__config.voice_player_input:
-                if custom_values.__contains__(comm_consts.KEY_ACTOR_PC_VOICEMODEL):
-                    tts_voice_model = self.__get_player_voice_model(str(custom_values[comm_consts.KEY_ACTOR_PC_VOICEMODEL]))
-                else:
-                    tts_voice_model = self.__get_player_voice_model(None)
-
-            return Character(base_id,
+    def load_character(self, json: dict[str, Any], loaded_characters: dict[str, Character] | None = None) -> Character | None:
+        talk: conversation | None = self.__talk
+        for required_key in (_K_REFID, _K_BASEID, _K_NAME):
+            if required_key not in json:
+                logging.warning(f"Actor is missing '{required_key}' and will be ignored")
+                return None
+        ref_id: str = self.__strip_plugin_id(utils.convert_to_skyrim_hex_format(str(json[_K_REFID])))
+        character_name: str = str(json[_K_NAME])
+        is_in_combat: bool
+        is_enemy: bool
+        relationship_rank: int
+        is_player_character: bool
+        (is_in_combat, is_enemy, relationship_rank, is_player_character) = [caster(json.get(key, default)) for key, caster, default in _ACTOR_FIELDS]
+        custom_values: dict[str, Any] = json.get(_K_CUSTOMVALUES) or {}
+        equipment_json: dict[str, Any] | None = json.get(_K_EQUIPMENT)
+        equipment: Equipment = Equipment(self.__convert_to_equipment_item_dictionary(equipment_json)) if equipment_json else _EMPTY_EQUIPMENT
+        if loaded_characters is None:
+            loaded_characters = talk.get_characters_by_ref_id() if talk else {}
+        already_loaded_character: Character | None = loaded_characters.get(ref_id)
+        if already_loaded_character:
+            # Only the transient stats can change for a character that is already loaded, reuse everything else
+            return Character(already_loaded_character.base_id,
                             ref_id,
                             character_name,
-                            gender,
-                            race,
+                            already_loaded_character.gender,
+                            already_loaded_character.race,
                             is_player_character,
-                            bio,
+                            already_loaded_character.bio,
                             is_in_combat,
                             is_enemy,
                             relationship_rank,
-                            is_generic_npc,
-                            ingame_voice_model,
-                            tts_voice_model,
-                            csv_in_game_voice_model,
-                            advanced_voice_model,
-                            voice_accent,
+                            already_loaded_character.is_generic_npc,
+                            already_loaded_character.in_game_voice_model,
+                            already_loaded_character.tts_voice_model,
+                            already_loaded_character.csv_in_game_voice_model,
+                            already_loaded_character.advanced_voice_model,
+                            already_loaded_character.voice_accent,
                             equipment,
                             custom_values)
-        except CharacterDoesNotExist:                 
-            logging.log(23, 'Restarting...')
-            return None 
-        
+
+        base_id: str = self.__strip_plugin_id(utils.convert_to_skyrim_hex_format(str(json[_K_BASEID])))
+        gender: int
+        race: str
+        actor_voice_model: str
+        (gender, race, actor_voice_model) = [caster(json.get(key, default)) for key, caster, default in _ACTOR_IDENTITY_FIELDS]
+        ingame_voice_model: str = actor_voice_model.partition('<')[2].partition(' ')[0]
+        is_generic_npc: bool = False
+        bio: str = ""
+        tts_voice_model: str = ""
+        csv_in_game_voice_model: str = ""
+        advanced_voice_model: str = ""
+        voice_accent: str = ""
+        if talk and not is_player_character :#If this is not the player and the character has not already been loaded
+            try:
+                external_info: external_character_info = self.__game.load_external_character_info(base_id, character_name, race, gender, actor_voice_model)
+            except CharacterDoesNotExist:
+                logging.log(23, 'Restarting...')
+                return None
+
+            bio = external_info.bio
+            tts_voice_model = external_info.tts_voice_model
+            csv_in_game_voice_model = external_info.csv_in_game_voice_model
+            advanced_voice_model = external_info.advanced_voice_model
+            voice_accent = external_info.voice_accent
+            is_generic_npc = external_info.is_generic_npc
+            if is_generic_npc:
+                character_name = external_info.name
+                ingame_voice_model = external_info.ingame_voice_model
+        elif talk and is_player_character and self.__config.voice_player_input:
+            player_voice_model = custom_values.get(_K_PC_VOICEMODEL)
+            tts_voice_model = self.__get_player_voice_model(str(player_voice_model) if player_voice_model is not None else None)
+
+        return Character(base_id,
+                        ref_id,
+                        character_name,
+                        gender,
+                        race,
+                        is_player_character,
+                        bio,
+                        is_in_combat,
+                        is_enemy,
+                        relationship_rank,
+                        is_generic_npc,
+                        ingame_voice_model,
+                        tts_voice_model,
+                        csv_in_game_voice_model,
+                        advanced_voice_model,
+                        voice_accent,
+                        equipment,
+                        custom_values)
+
     def error_message(self, message: str) -> dict[str, Any]:
         return {
                 comm_consts.KEY_REPLYTYPE: "error",
                 "mantella_message": message
             }
     
-    @utils.time_it
+    @staticmethod
+    def __strip_plugin_id(form_id: str) -> str:
+        # ignore plugin ID at the start of the ID as this can vary by load order
+        if form_id.startswith('FE'):                #Item from lite mod, statically placed in CK, has 'FEXXX' prefix. 
+            return form_id[-3:].rjust(6,"0")        #Mask off prefix, pad w/'0'
+        return form_id[-6:]
+
     def __get_player_voice_model(self, game_value: str | None) -> str:
         if game_value == None:
             return self.__config.player_voice_model
         return game_value
     
-    @utils.time_it
-    def __convert_to_equipment_item_dictionary(self, input_dict: dict[str, Any]) -> dict[str, EquipmentItem]:
+    def __convert_to_equipment_item_dictionary(self, input_dict: dict[str, Any] | None) -> dict[str, EquipmentItem]:
         result: dict[str, EquipmentItem] = {}
         if input_dict:
             for slot, itemname in input_dict.items():
-                result[slot] = EquipmentItem(itemname)
+                result[slot] = _make_equipment_item(itemname)
         return result
 
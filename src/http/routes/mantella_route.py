@@ -3,6 +3,7 @@ import logging
 from typing import Any, Hashable
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from src.config.config_loader import ConfigLoader
 from src.games.fallout4 import fallout4
 from src.games.gameable import gameable
@@ -101,4 +102,5 @@ class mantella_route(routeable):
 
             if self._show_debug_messages:
                 logging.log(self._log_level_http_out, json.dumps(reply, indent=4))
-            return reply
+            # replies only contain plain JSON types, so serialize them directly instead of letting FastAPI walk them with jsonable_encoder first
+            return JSONResponse(content=reply)
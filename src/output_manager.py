@@ -80,14 +80,14 @@ class ChatManager:
             return self.__client.num_tokens_from_message(content_to_measure)
 
     @utils.time_it
-    def generate_response(self, messages: message_thread, characters: Characters, blocking_queue: sentence_queue, actions: list[action]):
+    def generate_response(self, messages: message_thread, characters: Characters, blocking_queue: sentence_queue, actions: tuple[action, ...]):
         """Starts generating responses by the LLM for the current state of the input messages
 
         Args:
             messages (message_thread): _description_
             characters (Characters): _description_
             blocking_queue (sentence_queue): _description_
-            actions (list[action]): _description_
+            actions (tuple[action, ...]): _description_
         """
         if(not characters.last_added_character):
             return
@@ -169,7 +169,7 @@ class ChatManager:
         return sentence
 
     @utils.time_it
-    def __matching_action_keyword(self, keyword: str, actions: list[action]) -> action | None:
+    def __matching_action_keyword(self, keyword: str, actions: tuple[action, ...]) -> action | None:
         for a in actions:
             if keyword.lower() == a.keyword.lower():
                 return a
@@ -184,7 +184,7 @@ class ChatManager:
         return None
 
     @utils.time_it
-    async def process_response(self, active_character: Character, blocking_queue: sentence_queue, messages : message_thread, characters: Characters, actions: list[action]):
+    async def process_response(self, active_character: Character, blocking_queue: sentence_queue, messages : message_thread, characters: Characters, actions: tuple[action, ...]):
         """Stream response from LLM one sentence at a time"""
 
         try:
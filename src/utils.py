@@ -1,4 +1,5 @@
 import time
+import functools
 import logging
 import re
 import string
@@ -100,6 +101,7 @@ def cleanup_mei(remove_mei_folders: bool):
             else:
                 logging.warn(f"Warning: {len(mei_files)} previous Mantella.exe runtime folder(s) found in {dir_mei}. See MantellaSoftware/config.ini's remove_mei_folders setting for more information.")
         
+@functools.lru_cache(maxsize=4096)
 def convert_to_skyrim_hex_format(identifier: str) -> str:
     intID = int(identifier)
     if intID < 0: